@@ -1,3 +1,23 @@
-from .araviscamera import AravisCamera as AravisCamera
+from typing import TYPE_CHECKING, Any
 
-__all__ = ["AravisCamera"]
+if TYPE_CHECKING:
+    from .araviscamera import AravisCamera as AravisCamera
+    from .interfaces import IAravisPixelCorrection as IAravisPixelCorrection
+    from .interfaces import IAravisProfiling as IAravisProfiling
+    from .interfaces import IAravisSettings as IAravisSettings
+
+__all__ = ["AravisCamera", "IAravisPixelCorrection", "IAravisProfiling", "IAravisSettings"]
+
+
+def __getattr__(name: str) -> Any:
+    # AravisCamera and its interfaces pull in all of pyobs, so only import them when actually asked for -- e.g.
+    # the aravis-gui device listing never needs them
+    if name == "AravisCamera":
+        from .araviscamera import AravisCamera
+
+        return AravisCamera
+    if name in ("IAravisPixelCorrection", "IAravisProfiling", "IAravisSettings"):
+        from . import interfaces
+
+        return getattr(interfaces, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
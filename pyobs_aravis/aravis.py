@@ -6,12 +6,9 @@ Just in case the repo goes offline sometime. Some changes were applied.
 
 import time
 import logging
-import numpy as np
-import ctypes
-import gi
 
-gi.require_version("Aravis", "0.8")
-from gi.repository import Aravis
+# GObject introspection, ctypes and numpy are slow to load, so they are only imported on first use
+Aravis = None
 
 __author__ = "Olivier Roulet-Dubonnet, Morten Lind"
 __copyright__ = "Copyright 2011-2013, Sintef Raufoss Manufacturing"
@@ -23,6 +20,21 @@ class AravisException(Exception):
     pass
 
 
+def load_aravis():
+    """
+    import the aravis introspection bindings, only done on first call
+    """
+    global Aravis
+    if Aravis is None:
+        import gi
+
+        gi.require_version("Aravis", "0.8")
+        from gi.repository import Aravis as _Aravis
+
+        Aravis = _Aravis
+    return Aravis
+
+
 class Camera(object):
     """
     Create a Camera object.
@@ -38,7 +50,7 @@ class Camera(object):
         self.logger.setLevel(loglevel)
         self.name = name
         try:
-            self.cam = Aravis.Camera.new(name)
+            self.cam = load_aravis().Camera.new(name)
         except TypeError:
             if name:
                 raise AravisException("Error the camera %s was not found", name)
@@ -52,6 +64,14 @@ class Camera(object):
             raise AravisException("Error creating buffer")
         self._frame = None
         self._last_payload = 0
+        # optional StageProfiler (see profiling.py) for timing buffer waits and frame conversion
+        self.profiler = None
+        # optional PixelCorrection (see correction.py), applied while copying frames out of their buffers
+        self._correction = None
+        self._correction_warned = False
+        # frame ID and host arrival time in ns of the last frame returned by try_pop_frame()
+        self.last_frame_id = 0
+        self.last_system_timestamp = 0
 
     def __getattr__(self, name):
         if hasattr(
@@ -63,6 +83,19 @@ class Camera(object):
         else:
             raise AttributeError(name)
 
+    @property
+    def correction(self):
+        return self._correction
+
+    @correction.setter
+    def correction(self, correction):
+        """
+        set PixelCorrection to apply to frames, or None to just copy them.
+        warns again about a shape mismatch with the new one
+        """
+        self._correction = correction
+        self._correction_warned = False
+
     def __dir__(self):
         tmp = list(self.__dict__.keys()) + self.cam.__dir__()  # + self.dev.__dir__()
         return tmp
@@ -157,16 +190,38 @@ class Camera(object):
             payload = self.cam.get_payload()
         self.logger.info("Creating %s memory buffers of size %s", nb, payload)
         for _ in range(0, nb):
-            self.stream.push_buffer(Aravis.Buffer.new_allocate(payload))
+            self.stream.push_buffer(load_aravis().Buffer.new_allocate(payload))
+
+    def recreate_stream(self):
+        """
+        drop the stream together with its buffers and create a new one, e.g. after it stalled
+        buffers are allocated again on the next start_acquisition()
+        """
+        self.cam.stop_acquisition()
+        del self.stream
+        self.stream = self.cam.create_stream(None, None)
+        if self.stream is None:
+            raise AravisException("Error creating buffer")
+        self._last_payload = 0
+
+    def flush_frames(self):
+        """
+        requeue all frames that are waiting to be popped, e.g. after changing settings
+        """
+        buf = self.stream.try_pop_buffer()
+        while buf:
+            self.stream.push_buffer(buf)
+            buf = self.stream.try_pop_buffer()
 
     def pop_frame(self, timestamp=False):
+        wait_start = time.perf_counter_ns()
         while (
             True
         ):  # loop in python in order to allow interrupt, have the loop in C might hang
             if timestamp:
-                ts, frame = self.try_pop_frame(timestamp)
+                ts, frame = self.try_pop_frame(timestamp, wait_start=wait_start)
             else:
-                frame = self.try_pop_frame()
+                frame = self.try_pop_frame(wait_start=wait_start)
 
             if frame is None:
                 time.sleep(0.001)
@@ -176,13 +231,23 @@ class Camera(object):
                 else:
                     return frame
 
-    def try_pop_frame(self, timestamp=False):
+    def try_pop_frame(self, timestamp=False, wait_start=None):
         """
         return the oldest frame in the aravis buffer
+        wait_start is the perf_counter_ns() time the caller started waiting for a frame, for profiling
         """
         buf = self.stream.try_pop_buffer()
+        if buf and buf.get_status() != load_aravis().BufferStatus.SUCCESS:
+            # incomplete, timed out or wrongly sized buffer -- requeue it instead of handing out garbage
+            self.logger.warning("Dropping frame with buffer status %s", buf.get_status())
+            self.stream.push_buffer(buf)
+            buf = None
         if buf:
+            if self.profiler is not None and wait_start is not None:
+                self.profiler.record("buffer_wait", wait_start)
             frame = self._array_from_buffer_address(buf)
+            self.last_frame_id = buf.get_frame_id()
+            self.last_system_timestamp = buf.get_system_timestamp()
             self.stream.push_buffer(buf)
             if timestamp:
                 return buf.get_timestamp(), frame
@@ -197,6 +262,10 @@ class Camera(object):
     def _array_from_buffer_address(self, buf):
         if not buf:
             return None
+        import ctypes
+        import numpy as np
+
+        start = time.perf_counter_ns()
         pixel_format = buf.get_image_pixel_format()
         bits_per_pixel = pixel_format >> 16 & 0xFF
         if bits_per_pixel == 8:
@@ -206,7 +275,22 @@ class Camera(object):
         addr = buf.get_data()
         ptr = ctypes.cast(addr, INTP)
         im = np.ctypeslib.as_array(ptr, (buf.get_image_height(), buf.get_image_width()))
-        im = im.copy()
+        converted = time.perf_counter_ns()
+        if self.correction is not None and self.correction.shape == im.shape:
+            im = self.correction.apply(im)
+        else:
+            if self.correction is not None and not self._correction_warned:
+                # e.g. after changing ROI or binning -- only say so once, not for every frame
+                self.logger.warning(
+                    "Pixel correction is for frames of shape %s, but got %s, not applying it",
+                    self.correction.shape,
+                    im.shape,
+                )
+                self._correction_warned = True
+            im = im.copy()
+        if self.profiler is not None:
+            self.profiler.record("conversion", start, converted)
+            self.profiler.record("copy", converted)
         return im
 
     def trigger(self):
@@ -225,7 +309,9 @@ class Camera(object):
         self.logger.info("starting acquisition")
         payload = self.cam.get_payload()
         if payload != self._last_payload:
-            # FIXME should clear buffers
+            if self._last_payload:
+                # buffers of the old size are still queued, drop them together with the stream
+                self.recreate_stream()
             self.create_buffers(nb_buffers, payload)
             self._last_payload = payload
         self.cam.start_acquisition()
@@ -256,9 +342,10 @@ class Camera(object):
 
 
 def get_device_ids():
-    Aravis.update_device_list()
-    n = Aravis.get_n_devices()
-    return [Aravis.get_device_id(i) for i in range(0, n)]
+    aravis = load_aravis()
+    aravis.update_device_list()
+    n = aravis.get_n_devices()
+    return [aravis.get_device_id(i) for i in range(0, n)]
 
 
 def show_frame(frame):
@@ -269,6 +356,8 @@ def show_frame(frame):
 
 
 def save_frame(frame, path="frame.png"):
+    import numpy as np
+
     print("Saving frame to ", path)
     np.save(path, frame)
 
@@ -1,14 +1,24 @@
 import asyncio
+import json
 import logging
 import threading
 import time
 from collections.abc import Callable
-from typing import Any
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
 
 import numpy.typing as npt
+from astropy.io import fits
+from pyobs.images import Image
 from pyobs.interfaces import ExposureTimeState, IExposureTime
 from pyobs.modules.camera import BaseVideo
 
+from .interfaces import IAravisPixelCorrection, IAravisProfiling, IAravisSettings
+from .profiling import StageProfiler
+
+if TYPE_CHECKING:
+    from .correction import PixelCorrection
+
 log = logging.getLogger(__name__)
 
 # aravis/GLib calls are blocking and are made directly on the event loop thread (see _run_blocking).
@@ -16,13 +26,86 @@ log = logging.getLogger(__name__)
 # rather than let a single dead camera freeze the whole module.
 _SDK_CALL_TIMEOUT = 5.0
 
-# pop_frame() is polled from _capture() and is expected to legitimately take a while (up to the
-# camera's own frame interval/exposure time), unlike the other SDK calls above -- a much more
-# generous timeout than _SDK_CALL_TIMEOUT, so normal operation never trips it.
+# waiting for a frame (see _wait_for_frame) legitimately takes up to the camera's own frame interval or
+# exposure time, so it's normally bounded by the watchdog's stall timeout (see _stall_timeout) -- this much
+# more generous timeout is only the fallback if the frame interval is unknown, the camera is waiting for
+# triggers, or the watchdog is disabled.
 _FRAME_WAIT_TIMEOUT = 30.0
 
-
-class AravisCamera(BaseVideo, IExposureTime):
+# the watchdog considers the stream stalled after a few expected frame intervals without a frame, but
+# never sooner than this, so that fast cameras don't trip it on the odd scheduling hiccup
+_MIN_STALL_TIMEOUT = 1.0
+
+# pause between two attempts to recover a stalled stream, if all recovery steps failed
+_RECOVERY_BACKOFF = 5.0
+
+# reconnecting means device discovery, GenICam download and writing all settings, which takes much longer
+# than a single SDK call
+_RECONNECT_TIMEOUT = 30.0
+
+# GenICam features that change the payload or the acquisition setup, and which most cameras refuse to
+# write while streaming (TLParamsLocked) -- writing any of these stops and restarts acquisition right
+# away, all other features are first tried while the stream keeps running, and only if the camera
+# refuses that, written with acquisition stopped as well
+_RESTART_FEATURES = {
+    "Width",
+    "Height",
+    "OffsetX",
+    "OffsetY",
+    "PixelFormat",
+    "BinningHorizontal",
+    "BinningVertical",
+    "DecimationHorizontal",
+    "DecimationVertical",
+    "AcquisitionMode",
+    "TriggerMode",
+    "TriggerSource",
+}
+
+# written via Camera.set_exposure_time() instead of set_feature(), since aravis maps that to the
+# vendor-specific feature (e.g. ExposureTimeAbs) -- value in microseconds, like the GenICam feature
+_EXPOSURE_TIME_FEATURE = "ExposureTime"
+
+
+def _frame_id_after(frame_id: int, reference: int) -> bool:
+    """Whether a frame ID comes after the reference ID.
+
+    GigE Vision frame IDs are only 16 bit wide and wrap around, so IDs are compared modulo 2^16, which works
+    as long as both are less than 32768 frames apart.
+    """
+    return 0 < (frame_id - reference) % 0x10000 < 0x8000
+
+
+@dataclass
+class _Frame:
+    """A frame together with the metadata needed to tag settings changes."""
+
+    data: npt.NDArray[Any]
+    frame_id: int
+    system_timestamp: int
+    # generation of settings this frame was taken with, see AravisCamera.apply_settings()
+    settings_generation: int = 0
+
+
+@dataclass
+class _SettingsTransaction:
+    """A batch of feature writes, applied between two frames."""
+
+    settings: dict[str, Any]
+    applied: asyncio.Future[None]
+    first_frame: asyncio.Future[int]
+    generation: int = 0
+    # if acquisition was restarted, all frames taken before have been flushed, so the next one is new...
+    restarted: bool = False
+    # ...otherwise the first frame reflecting the settings must have an ID past this one...
+    after_frame_id: int = 0
+    # ...and must have arrived at or after this host time in ns...
+    not_before: int = 0
+    # ...or, if the camera provides neither, come after this many frames still in flight with old settings
+    frames_left: int = 0
+
+
+class AravisCamera(BaseVideo, IExposureTime, IAravisProfiling, IAravisSettings, IAravisPixelCorrection):
     """A pyobs module for Aravis cameras."""
 
     __module__ = "pyobs_aravis"
@@ -32,6 +115,11 @@ class AravisCamera(BaseVideo, IExposureTime):
         device: str,
         settings: dict[str, Any] | None = None,
         buffers: int = 5,
+        profile: bool = False,
+        profile_size: int = 4096,
+        watchdog: bool = True,
+        stall_frames: float = 5.0,
+        pixel_correction: str | None = None,
         **kwargs: Any,
     ):
         """Initializes a new AravisCamera.
@@ -40,6 +128,14 @@ class AravisCamera(BaseVideo, IExposureTime):
             device: Name of camera to connect to.
             settings: Dictionary of camera settings to apply on connect.
             buffers: Number of acquisition buffers.
+            profile: Whether to record timings of the capture stages from the start.
+            profile_size: Number of timing samples to keep per capture stage.
+            watchdog: Whether to detect stalled streams and recover from them. Disabled automatically while
+                the camera is in trigger mode, since frames then only arrive on triggers.
+            stall_frames: Number of expected frame intervals without a frame, after which the stream is
+                considered stalled.
+            pixel_correction: Name of .npz file in the VFS with pixel correction maps, as written by
+                create_pixel_correction().
         """
         BaseVideo.__init__(self, **kwargs)
         from . import aravis
@@ -50,6 +146,26 @@ class AravisCamera(BaseVideo, IExposureTime):
         self._camera_lock = asyncio.Lock()
         self._buffers = buffers
         self._exposure_time: float = 0.0
+        self._profiler = StageProfiler(size=profile_size, enabled=profile)
+        self._pending_settings: list[_SettingsTransaction] = []
+        # wakes up a frame wait in the capture loop, so queued settings don't wait for the next frame
+        self._settings_pending = threading.Event()
+        self._untagged_settings: list[_SettingsTransaction] = []
+        self._settings_generation = 0
+        self._published_generation = 0
+        self._current_frame: _Frame | None = None
+        self._watchdog = watchdog
+        self._stall_frames = stall_frames
+        self._frame_interval: float | None = None
+        self._triggered = False
+        self._stalled = False
+        self._open_lock = threading.Lock()
+        self._pixel_correction_file = pixel_correction
+        self._pixel_correction: PixelCorrection | None = None
+        self._capturing_darks = False
+        self._frame_queues: list[asyncio.Queue[_Frame]] = []
+        self._opened_at: float | None = None
+        self._first_frame_received = asyncio.Event()
 
         if device is not None:
             self.add_background_task(self._capture)
@@ -60,6 +176,7 @@ class AravisCamera(BaseVideo, IExposureTime):
         """Open module."""
         from . import aravis
 
+        self._opened_at = time.monotonic()
         await BaseVideo.open(self)
 
         # device discovery is a blocking, network-based scan (GigE Vision/USB3 Vision devices
@@ -77,6 +194,16 @@ class AravisCamera(BaseVideo, IExposureTime):
         if self._camera_device_name not in ids:
             raise ValueError("Could not find given device name in list of available cameras.")
 
+        if self._pixel_correction_file is not None:
+            from .correction import PixelCorrection
+
+            log.info("Loading pixel correction maps from %s...", self._pixel_correction_file)
+            async with self.vfs.open_file(self._pixel_correction_file, "rb") as f:
+                data = await f.read()
+            if not isinstance(data, bytes):
+                raise ValueError(f"Could not read pixel correction maps from {self._pixel_correction_file} as binary.")
+            self._pixel_correction = PixelCorrection.from_bytes(data)
+
         await self.activate_camera()
 
         # publish initial exposure-time state -- otherwise a caller doing wait_for_state()
@@ -92,16 +219,114 @@ class AravisCamera(BaseVideo, IExposureTime):
         """Open camera."""
         from . import aravis
 
-        log.info("Connecting to camera %s...", self._camera_device_name)
-        self._camera = aravis.Camera(self._camera_device_name)  # type: ignore[assignment]
-        log.info("Connected.")
+        # a previous attempt that timed out (see _run_blocking) may still be running in the background -- never
+        # let two of them open the same device
+        if not self._open_lock.acquire(blocking=False):
+            raise RuntimeError("Still connecting to camera from a previous attempt.")
+        try:
+            log.info("Connecting to camera %s...", self._camera_device_name)
+            self._camera = aravis.Camera(self._camera_device_name)  # type: ignore[assignment]
+            log.info("Connected.")
+            self._camera.profiler = self._profiler  # type: ignore[union-attr]
+            # darks must be captured uncorrected, even if the watchdog reconnects in the middle of it
+            self._camera.correction = None if self._capturing_darks else self._pixel_correction
+
+            for key, value in self._settings.items():
+                self._set_feature(key, value)
+
+            self._camera.start_acquisition_continuous(nb_buffers=self._buffers)  # type: ignore[union-attr]
+            self._update_frame_interval()
+            self._stalled = False
+        finally:
+            self._open_lock.release()
+
+    def _update_frame_interval(self) -> None:
+        """Read the expected time between two frames from the camera, for the watchdog."""
+        try:
+            self._triggered = self._camera.get_feature("TriggerMode") == "On"  # type: ignore[union-attr]
+        except Exception:
+            # no trigger support at all
+            self._triggered = False
+        if self._triggered:
+            # frames only come on triggers, so there's no frame interval to expect
+            self._frame_interval = None
+            return
 
-        for key, value in self._settings.items():
-            log.info("Setting value %s=%s...", key, value)
+        try:
+            frame_rate = self._camera.get_frame_rate()  # type: ignore[union-attr]
+            exposure_time = self._camera.get_exposure_time() / 1e6  # type: ignore[union-attr]
+        except Exception:
+            log.warning("Could not determine frame interval, falling back to %.1fs stall timeout.", _FRAME_WAIT_TIMEOUT)
+            self._frame_interval = None
+            return
+
+        # a frame can't come faster than the exposure takes, whatever the frame rate says
+        self._frame_interval = max(1.0 / frame_rate if frame_rate > 0 else 0.0, exposure_time)
+
+    def _stall_timeout(self) -> float:
+        """Time without a frame after which the stream is considered stalled."""
+        if not self._watchdog or self._triggered or self._frame_interval is None:
+            return _FRAME_WAIT_TIMEOUT
+        return max(self._stall_frames * self._frame_interval, _MIN_STALL_TIMEOUT)
+
+    def _set_feature(self, key: str, value: Any) -> None:
+        """Write a single feature to the camera."""
+        log.info("Setting value %s=%s...", key, value)
+        if key == _EXPOSURE_TIME_FEATURE:
+            self._camera.set_exposure_time(value)  # type: ignore[union-attr]
+        else:
             self._camera.set_feature(key, value)  # type: ignore[union-attr]
 
+    def _write_settings(self, settings: dict[str, Any]) -> bool:
+        """Write a batch of features, restarting acquisition only if one of them requires it.
+
+        Returns:
+            Whether acquisition was restarted.
+        """
+        if self._camera is None:
+            raise ValueError("Camera is not connected.")
+
+        # try everything not known to be locked while streaming live first, and collect what the camera refuses
+        locked = {key: value for key, value in settings.items() if key in _RESTART_FEATURES}
+        for key, value in settings.items():
+            if key in locked:
+                continue
+            try:
+                self._set_feature(key, value)
+            except Exception as e:
+                log.info("Could not write %s while streaming (%s), retrying with acquisition stopped.", key, e)
+                locked[key] = value
+
+        if locked:
+            log.info("Stopping acquisition for changing settings...")
+            self._camera.stop_acquisition()  # type: ignore[union-attr]
+            try:
+                for key, value in locked.items():
+                    self._set_feature(key, value)
+            finally:
+                # frames taken with the old settings are still queued -- drop them, so that the next frame is new;
+                # if the payload changed, start_acquisition() replaces the stream with all its buffers anyway
+                self._camera.flush_frames()  # type: ignore[union-attr]
+                self._camera.start_acquisition_continuous(nb_buffers=self._buffers)  # type: ignore[union-attr]
+
+        self._update_frame_interval()
+        return bool(locked)
+
+    def _restart_acquisition(self) -> None:
+        """Stop and start acquisition on the existing stream, keeping its buffers."""
+        self._camera.stop_acquisition()  # type: ignore[union-attr]
+        self._camera.start_acquisition_continuous(nb_buffers=self._buffers)  # type: ignore[union-attr]
+
+    def _recreate_stream(self) -> None:
+        """Replace the stream on the existing device connection, then start acquisition again."""
+        self._camera.recreate_stream()  # type: ignore[union-attr]
         self._camera.start_acquisition_continuous(nb_buffers=self._buffers)  # type: ignore[union-attr]
 
+    def _reconnect_camera(self) -> None:
+        """Close the connection to the camera and open it again, applying all cached settings."""
+        self._close_camera()
+        self._open_camera()
+
     def _close_camera(self) -> None:
         """Close camera."""
         if self._camera is not None:
@@ -113,8 +338,7 @@ class AravisCamera(BaseVideo, IExposureTime):
                 log.exception("Error closing camera.")
         self._camera = None
 
-    @staticmethod
-    async def _run_blocking(func: Callable[[], None], timeout: float = _SDK_CALL_TIMEOUT) -> bool:
+    async def _run_blocking(self, func: Callable[[], None], timeout: float = _SDK_CALL_TIMEOUT) -> bool:
         """Run a blocking aravis/GLib call in a daemon thread, so a hung call can't freeze the module.
 
         A plain executor isn't used here, since its worker threads are non-daemon and Python joins
@@ -125,12 +349,19 @@ class AravisCamera(BaseVideo, IExposureTime):
         """
         loop = asyncio.get_running_loop()
         future: asyncio.Future[None] = loop.create_future()
+        started = self._profiler.now()
+
+        def _done() -> None:
+            # after a timeout, wait_for() has already cancelled the future
+            if not future.done():
+                future.set_result(None)
 
         def _wrapper() -> None:
+            self._profiler.record("thread_start", started)
             try:
                 func()
             finally:
-                loop.call_soon_threadsafe(future.set_result, None)
+                loop.call_soon_threadsafe(_done)
 
         threading.Thread(target=_wrapper, daemon=True).start()
         try:
@@ -158,67 +389,360 @@ class AravisCamera(BaseVideo, IExposureTime):
         last = time.time()
         while True:
             try:
-                if self._camera is None or not self.camera_active:
+                if not self.camera_active or (self._camera is None and not self._stalled):
                     await asyncio.sleep(0.1)
                     continue
 
-                frame = await self._wait_for_frame()
+                if self._stalled:
+                    if not await self._recover():
+                        await asyncio.sleep(_RECOVERY_BACKOFF)
+                    continue
+
+                # we're between two frames here, so that's where queued settings go
+                if self._pending_settings:
+                    await self._apply_pending_settings()
+
+                frame = await self._wait_for_frame(timeout=self._stall_timeout(), wake_on_settings=True)
                 if frame is None:
-                    # camera went away, or the wait timed out -- back off and retry
+                    # camera went away, settings got queued, or the wait timed out -- in the latter case, let the
+                    # watchdog take over, unless the camera is simply waiting for a trigger
+                    if self._pending_settings:
+                        continue
+                    if self._watchdog and not self._triggered and self._camera is not None:
+                        self._stalled = True
                     continue
+                if self._opened_at is not None:
+                    # startup time is mostly connecting and setting up the stream, so keep an eye on it
+                    log.info("Received first frame %.2fs after opening module.", time.monotonic() - self._opened_at)
+                    self._opened_at = None
+                    self._first_frame_received.set()
+                for queue in self._frame_queues:
+                    queue.put_nowait(frame)
 
                 if time.time() - last < self._interval:
                     await asyncio.sleep(0.01)
                     continue
 
+                # only tag frames that actually get published, so the tagged frame can't be dropped
+                self._tag_frame(frame)
                 last = time.time()
-                await self._set_image(frame)
+                started = self._profiler.now()
+                self._current_frame = frame
+                try:
+                    await self._set_image(frame.data)
+                finally:
+                    self._current_frame = None
+                self._profiler.record("set_image", started)
 
             except Exception:
                 await asyncio.sleep(1)
 
-    async def _wait_for_frame(self, timeout: float = _FRAME_WAIT_TIMEOUT) -> npt.NDArray[Any] | None:
+    async def _wait_for_frame(
+        self, timeout: float = _FRAME_WAIT_TIMEOUT, wake_on_settings: bool = False
+    ) -> _Frame | None:
         """Waits for the next frame without blocking the event loop.
 
-        Polls pop_frame() from a background thread (see _run_blocking) rather than polling it
-        directly from the async loop with a sleep in between each attempt -- pop_frame() is
+        Polls try_pop_frame() from a background thread (see _run_blocking) rather than polling it
+        directly from the async loop with a sleep in between each attempt -- try_pop_frame() is
         assumed non-blocking in the common case, but if the underlying aravis/GLib call ever
         doesn't honor that (camera hiccup, network stall for GigE Vision), polling it directly
         would freeze the whole module for as long as that lasts, repeatedly, for the module's
         entire runtime. Runs the whole "poll until ready" loop as a single blocking call instead,
-        so only one thread gets spawned per delivered frame rather than one per 10ms poll.
+        so only one thread gets spawned per delivered frame rather than one per 1ms poll. If the
+        wait times out, the polling thread is told to stop, so it doesn't keep running in the
+        background, competing with the next wait or with stream recovery.
+
+        Args:
+            timeout: Time to wait for a frame in seconds.
+            wake_on_settings: Whether to stop waiting as soon as settings get queued, so that they can be
+                applied right away instead of after the next frame, which may take long, e.g. in trigger mode.
 
         Returns:
-            The next frame, or None if the camera disappeared mid-wait or the wait timed out.
+            The next frame, or None if the camera disappeared mid-wait, settings got queued or the wait timed out.
         """
-        result: list[npt.NDArray[Any]] = []
+        result: list[_Frame] = []
+        stop = threading.Event()
 
         def _poll() -> None:
             camera = self._camera
-            while camera is not None:
-                frame = camera.pop_frame()  # type: ignore[union-attr]
-                # pop_frame() can return a non-None array that's empty along axis 0 instead of
+            wait_start = time.perf_counter_ns()
+            while camera is not None and not stop.is_set():
+                if wake_on_settings and self._settings_pending.is_set():
+                    return
+                frame = camera.try_pop_frame(wait_start=wait_start)  # type: ignore[union-attr]
+                # try_pop_frame() can return a non-None array that's empty along axis 0 instead of
                 # None -- treat that the same as "not ready yet" rather than a real frame
                 if frame is not None and frame.size != 0:  # type: ignore[union-attr]
-                    result.append(frame)  # type: ignore[arg-type]
+                    result.append(_Frame(frame, camera.last_frame_id, camera.last_system_timestamp))  # type: ignore
                     return
-                time.sleep(0.01)
+                time.sleep(0.001)
 
         if not await self._run_blocking(_poll, timeout=timeout):
-            log.error("Timed out waiting for a frame after %.1fs.", timeout)
+            stop.set()
+            if self._triggered:
+                # nothing wrong here, there just hasn't been a trigger
+                log.debug("No trigger within %.1fs.", timeout)
+            else:
+                log.error("Timed out waiting for a frame after %.1fs.", timeout)
             return None
         return result[0] if result else None
 
+    async def _recover(self) -> bool:
+        """Try to get a stalled stream going again, escalating from cheap to expensive measures.
+
+        Restarting acquisition keeps stream and buffers, recreating the stream keeps the device
+        connection, and only reconnecting starts from scratch, applying all cached settings again.
+
+        Returns:
+            Whether a frame has been received after one of the recovery steps.
+        """
+        steps: list[tuple[str, Callable[[], None], float]] = [
+            ("restarting acquisition", self._restart_acquisition, _SDK_CALL_TIMEOUT),
+            ("recreating stream", self._recreate_stream, _SDK_CALL_TIMEOUT),
+            ("reconnecting", self._reconnect_camera, _RECONNECT_TIMEOUT),
+        ]
+        if self._camera is None:
+            # a previous reconnect failed, nothing else left to try
+            steps = steps[-1:]
+
+        started = time.monotonic()
+        for name, step, timeout in steps:
+            log.warning("Stream stalled, %s...", name)
+            errors: list[Exception] = []
+
+            def _step(step: Callable[[], None] = step) -> None:
+                try:
+                    step()
+                except Exception as e:
+                    errors.append(e)
+
+            async with self._camera_lock:
+                completed = await self._run_blocking(_step, timeout=timeout)
+            if not completed or errors:
+                log.error("Failed %s: %s", name, errors[0] if errors else f"timed out after {timeout}s")
+                continue
+
+            if await self._wait_for_frame(timeout=self._stall_timeout()) is not None:
+                log.info("Stream recovered by %s after %.1fs.", name, time.monotonic() - started)
+                self._stalled = False
+                return True
+
+        log.error("Could not recover stalled stream, retrying in %.1fs.", _RECOVERY_BACKOFF)
+        return False
+
+    async def _apply_pending_settings(self) -> None:
+        """Write all queued settings transactions to the camera in one go."""
+        self._settings_pending.clear()
+        transactions, self._pending_settings = self._pending_settings, []
+        settings: dict[str, Any] = {}
+        for transaction in transactions:
+            settings.update(transaction.settings)
+
+        errors: list[Exception] = []
+        restarted: list[bool] = []
+
+        def _write() -> None:
+            try:
+                restarted.append(self._write_settings(settings))
+            except Exception as e:
+                errors.append(e)
+
+        async with self._camera_lock:
+            completed = await self._run_blocking(_write)
+
+        if not completed or errors:
+            exc = errors[0] if errors else TimeoutError(f"Timed out writing settings after {_SDK_CALL_TIMEOUT}s.")
+            log.error("Could not apply settings %s: %s", settings, exc)
+            for transaction in transactions:
+                transaction.applied.set_exception(exc)
+            return
+
+        # keep settings for reconnects
+        self._settings.update(settings)
+
+        # frames queued in the stream and the one exposing right now were taken with the old settings: the first
+        # frame reflecting the new ones has an ID past all of those and, since an old frame can arrive up to one
+        # (old) exposure plus readout after the write, arrives no earlier than the longer of both exposures plus
+        # a frame interval from now
+        old_exposure_time = self._exposure_time
+        new_exposure_time = settings.get(_EXPOSURE_TIME_FEATURE, old_exposure_time * 1e6) / 1e6
+        wait = max(old_exposure_time, new_exposure_time) + (self._frame_interval or 0.0)
+        self._settings_generation += 1
+        if _EXPOSURE_TIME_FEATURE in settings:
+            self._exposure_time = new_exposure_time
+            await self.comm.set_state(IExposureTime, ExposureTimeState(exposure_time=new_exposure_time))
+        for transaction in transactions:
+            transaction.generation = self._settings_generation
+            transaction.restarted = restarted[0]
+            transaction.after_frame_id = self._camera.last_frame_id + self._buffers + 1  # type: ignore[union-attr]
+            transaction.not_before = time.time_ns() + int(wait * 1e9)
+            transaction.frames_left = self._buffers + 1
+            transaction.applied.set_result(None)
+            self._untagged_settings.append(transaction)
+
+    def _tag_frame(self, frame: _Frame) -> None:
+        """Resolve all applied settings transactions that are reflected in the given frame."""
+        remaining = []
+        for transaction in self._untagged_settings:
+            transaction.frames_left -= 1
+            if transaction.restarted:
+                reflected = True
+            elif frame.frame_id > 0 or frame.system_timestamp > 0:
+                # a frame ID or arrival time of zero means the camera doesn't provide it
+                reflected = (frame.frame_id == 0 or _frame_id_after(frame.frame_id, transaction.after_frame_id)) and (
+                    frame.system_timestamp == 0 or frame.system_timestamp >= transaction.not_before
+                )
+            else:
+                reflected = transaction.frames_left < 0
+
+            if not reflected:
+                remaining.append(transaction)
+                continue
+            self._published_generation = max(self._published_generation, transaction.generation)
+            if not transaction.first_frame.done():
+                log.info("Frame %d is the first one taken with settings %s.", frame.frame_id, transaction.settings)
+                transaction.first_frame.set_result(frame.frame_id)
+        self._untagged_settings = remaining
+        frame.settings_generation = self._published_generation
+
+    async def add_fits_headers(self, image: Image | fits.PrimaryHDU) -> None:
+        """Add FITS headers, including frame ID and settings generation of the frame being published.
+
+        Args:
+            image: Image with header to add to.
+        """
+        await BaseVideo.add_fits_headers(self, image)
+        if self._current_frame is not None:
+            image.header["FRAMEID"] = (self._current_frame.frame_id, "Frame ID from camera")
+            image.header["SETGEN"] = (self._current_frame.settings_generation, "Generation of camera settings")
+
+    async def _queue_settings(self, settings: dict[str, Any]) -> _SettingsTransaction:
+        """Queue a settings transaction for the capture loop and wait for it to be written."""
+        await self.activate_camera()
+
+        loop = asyncio.get_running_loop()
+        transaction = _SettingsTransaction(
+            settings=dict(settings), applied=loop.create_future(), first_frame=loop.create_future()
+        )
+        self._pending_settings.append(transaction)
+        self._settings_pending.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(transaction.applied), timeout=_FRAME_WAIT_TIMEOUT)
+        except TimeoutError:
+            if transaction in self._pending_settings:
+                self._pending_settings.remove(transaction)
+            raise TimeoutError(f"Timed out waiting for capture loop to apply settings after {_FRAME_WAIT_TIMEOUT}s.")
+        return transaction
+
+    async def apply_settings(self, settings: dict[str, Any], wait_for_frame: bool = True, **kwargs: Any) -> int | None:
+        """Write several camera features at once, between two frames.
+
+        Features that can be changed while streaming are written without interrupting acquisition, only
+        features that change the payload (like Width, Height or PixelFormat) or that the camera refuses to
+        change while streaming stop and restart it. Applied settings are kept and written again on reconnect.
+
+        Every applied batch increments the settings generation, which is written to the SETGEN header of
+        all published images, together with the camera's frame ID in FRAMEID.
+
+        Args:
+            settings: Dictionary of features to write.
+            wait_for_frame: Whether to wait for the first frame taken with the new settings.
+
+        Returns:
+            Frame ID of the first frame taken with the new settings, or None if not waiting for it.
+        """
+        transaction = await self._queue_settings(settings)
+        if not wait_for_frame:
+            return None
+        return await asyncio.wait_for(transaction.first_frame, timeout=_FRAME_WAIT_TIMEOUT)
+
     async def set_exposure_time(self, exposure_time: float, **kwargs: Any) -> None:
         """Set the exposure time in seconds.
 
         Args:
             exposure_time: Exposure time in seconds.
         """
+        # exposure time and its state are updated once the change has been applied
+        await self._queue_settings({_EXPOSURE_TIME_FEATURE: exposure_time * 1e6})
+
+    async def create_pixel_correction(
+        self, filename: str | None = None, frames: int = 50, sigma: float = 5.0, **kwargs: Any
+    ) -> None:
+        """Derive pixel correction maps from a sequence of dark frames and start using them.
+
+        The camera must be covered, so that the captured frames are darks. They are taken without any
+        previous correction applied.
+
+        Args:
+            filename: Name of .npz file in the VFS to write maps to, if any.
+            frames: Number of dark frames to capture.
+            sigma: Threshold for bad pixels in robust standard deviations of dark level and noise.
+        """
+        from .correction import DarkAccumulator
+
         await self.activate_camera()
-        self._camera.set_exposure_time(exposure_time * 1e6)  # type: ignore[union-attr]
-        self._exposure_time = exposure_time
-        await self.comm.set_state(IExposureTime, ExposureTimeState(exposure_time=exposure_time))
+        if self._camera is None:
+            raise ValueError("Camera is not connected.")
+
+        log.info("Capturing %d dark frames for pixel correction...", frames)
+        self._capturing_darks = True
+        self._camera.correction = None
+        accumulator = DarkAccumulator()
+        queue: asyncio.Queue[_Frame] = asyncio.Queue()
+        self._frame_queues.append(queue)
+        try:
+            # skip frames that may have been converted before the correction was switched off
+            skip = self._buffers
+            while accumulator.count < frames:
+                frame = await asyncio.wait_for(queue.get(), timeout=self._stall_timeout() + _SDK_CALL_TIMEOUT)
+                if skip > 0:
+                    skip -= 1
+                    continue
+                accumulator.add(frame.data)
+            self._pixel_correction = accumulator.correction(sigma=sigma)
+        finally:
+            self._frame_queues.remove(queue)
+            self._capturing_darks = False
+            if self._camera is not None:
+                self._camera.correction = self._pixel_correction
+        log.info("Found %d bad pixels.", int(self._pixel_correction.bad_pixels.sum()))
+
+        if filename is not None:
+            log.info("Writing pixel correction maps to %s...", filename)
+            async with self.vfs.open_file(filename, "wb") as f:
+                await f.write(self._pixel_correction.to_bytes())
+
+    async def set_profiling(self, enabled: bool, reset: bool = False, **kwargs: Any) -> None:
+        """Switch timing of the capture stages on or off.
+
+        Args:
+            enabled: Whether to record timings.
+            reset: Whether to drop all timings recorded so far.
+        """
+        if reset:
+            self._profiler.reset()
+        self._profiler.enabled = enabled
+        log.info("Profiling of capture stages %s.", "enabled" if enabled else "disabled")
+
+    async def get_profile(self, bins: int = 20, **kwargs: Any) -> dict[str, Any]:
+        """Returns histograms and statistics of the recorded capture stage timings.
+
+        Args:
+            bins: Number of histogram bins.
+
+        Returns:
+            Statistics per capture stage, all times in milliseconds.
+        """
+        return self._profiler.histograms(bins=bins)
+
+    async def dump_profile_trace(self, filename: str, **kwargs: Any) -> None:
+        """Writes the recorded capture stage timings as Chrome trace-event JSON.
+
+        Args:
+            filename: Name of file in the VFS to write trace to.
+        """
+        async with self.vfs.open_file(filename, "w") as f:
+            await f.write(json.dumps(self._profiler.chrome_trace()))
 
 
 __all__ = ["AravisCamera"]
@@ -0,0 +1,28 @@
+import argparse
+import sys
+
+
+def main() -> None:
+    """Entry point for aravis-gui.
+
+    Kept free of any heavy imports, so that listing devices doesn't have to load Qt, astropy and pyobs
+    first -- those are only imported once the GUI is actually started.
+    """
+    parser = argparse.ArgumentParser(description="Live preview and test exposures for Aravis cameras.")
+    parser.add_argument("--list", action="store_true", help="only list available devices and exit")
+    args, qt_args = parser.parse_known_args()
+
+    if args.list:
+        from . import aravis
+
+        for device in aravis.get_device_ids():
+            print(device)
+        return
+
+    from . import gui
+
+    gui.main([sys.argv[0], *qt_args])
+
+
+if __name__ == "__main__":
+    main()
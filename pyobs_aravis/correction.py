@@ -0,0 +1,220 @@
+import io
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+
+class PixelCorrection:
+    """Precomputed bad-pixel and column/row offset corrections for raw frames.
+
+    All maps are turned into flat index arrays and a full-frame offset map once, so correcting a frame is
+    a couple of in-place ufunc calls on the output array and a single fancy-indexing assignment for the
+    bad pixels, without any full-frame temporaries.
+    """
+
+    def __init__(
+        self,
+        shape: tuple[int, int],
+        bad_pixels: npt.NDArray[np.bool_] | None = None,
+        column_offsets: npt.NDArray[Any] | None = None,
+        row_offsets: npt.NDArray[Any] | None = None,
+    ):
+        """Initializes a new pixel correction.
+
+        Args:
+            shape: Shape (height, width) of frames to correct.
+            bad_pixels: Boolean mask of pixels to replace by the mean of their nearest good neighbours in
+                the same row.
+            column_offsets: Non-negative offset per column to subtract.
+            row_offsets: Non-negative offset per row to subtract.
+        """
+        height, width = shape
+        self.shape = (height, width)
+
+        if bad_pixels is not None and bad_pixels.shape != self.shape:
+            raise ValueError(f"Bad pixel mask has shape {bad_pixels.shape}, expected {self.shape}.")
+        if column_offsets is not None and column_offsets.shape != (width,):
+            raise ValueError(f"Column offsets have shape {column_offsets.shape}, expected ({width},).")
+        if row_offsets is not None and row_offsets.shape != (height,):
+            raise ValueError(f"Row offsets have shape {row_offsets.shape}, expected ({height},).")
+
+        self.bad_pixels = np.zeros(self.shape, dtype=bool) if bad_pixels is None else bad_pixels.astype(bool)
+        self.column_offsets = None if column_offsets is None else np.clip(column_offsets, 0, None)
+        self.row_offsets = None if row_offsets is None else np.clip(row_offsets, 0, None)
+
+        # combined offset map in float, the map in the frame's dtype is derived from it on first use
+        offsets = np.zeros(self.shape)
+        if self.column_offsets is not None:
+            offsets += self.column_offsets[None, :]
+        if self.row_offsets is not None:
+            offsets += self.row_offsets[:, None]
+        self._offsets = np.rint(offsets) if offsets.any() else None
+        self._typed_offsets: dict[np.dtype[Any], npt.NDArray[Any]] = {}
+
+        self._bad, self._left, self._right = self._neighbour_indices(self.bad_pixels)
+
+    @staticmethod
+    def _neighbour_indices(
+        mask: npt.NDArray[np.bool_],
+    ) -> tuple[npt.NDArray[np.intp], npt.NDArray[np.intp], npt.NDArray[np.intp]]:
+        """Finds flat indices of bad pixels and of their nearest good neighbours left and right.
+
+        If there is no good pixel on one side within the row, the one on the other side is used for both.
+        Pixels in rows without any good pixel are left alone.
+        """
+        height, width = mask.shape
+        columns = np.arange(width)
+        bad, left, right = [], [], []
+        for row in np.flatnonzero(mask.any(axis=1)):
+            good = columns[~mask[row]]
+            if good.size == 0:
+                continue
+            cols = columns[mask[row]]
+
+            # nearest good column at or left/right of each bad one, clamped to the row
+            pos = np.searchsorted(good, cols)
+            lft = good[np.clip(pos - 1, 0, good.size - 1)]
+            rgt = good[np.clip(pos, 0, good.size - 1)]
+            lft = np.where(lft < cols, lft, rgt)
+            rgt = np.where(rgt > cols, rgt, lft)
+
+            offset = row * width
+            bad.append(offset + cols)
+            left.append(offset + lft)
+            right.append(offset + rgt)
+
+        if not bad:
+            empty = np.empty(0, dtype=np.intp)
+            return empty, empty, empty
+        return (
+            np.concatenate(bad).astype(np.intp),
+            np.concatenate(left).astype(np.intp),
+            np.concatenate(right).astype(np.intp),
+        )
+
+    def _offsets_for(self, dtype: np.dtype[Any]) -> npt.NDArray[Any] | None:
+        """Returns the offset map in the given dtype, computing it once per dtype."""
+        if self._offsets is None:
+            return None
+        if dtype not in self._typed_offsets:
+            info = np.iinfo(dtype) if np.issubdtype(dtype, np.integer) else np.finfo(dtype)
+            self._typed_offsets[dtype] = np.clip(self._offsets, 0, info.max).astype(dtype)
+        return self._typed_offsets[dtype]
+
+    def apply(self, frame: npt.NDArray[Any], out: npt.NDArray[Any] | None = None) -> npt.NDArray[Any]:
+        """Corrects a frame, writing the result into a new or the given array.
+
+        This replaces the plain copy of a frame out of its acquisition buffer, so frame and out must not
+        be the same array. Offsets are subtracted with values clamped at zero, so unsigned frames don't
+        wrap around.
+
+        Args:
+            frame: Raw frame to correct, left untouched.
+            out: Array to write corrected frame to, defaults to a new one.
+
+        Returns:
+            The corrected frame.
+        """
+        if out is None:
+            out = np.empty_like(frame)
+
+        offsets = self._offsets_for(frame.dtype)
+        if offsets is None:
+            np.copyto(out, frame)
+        else:
+            np.maximum(frame, offsets, out=out)
+            np.subtract(out, offsets, out=out)
+
+        if self._bad.size:
+            flat = out.reshape(-1)
+            flat[self._bad] = (flat[self._left].astype(np.uint32) + flat[self._right]) // 2
+        return out
+
+    def to_bytes(self) -> bytes:
+        """Serializes the correction maps to the NumPy .npz format."""
+        maps: dict[str, Any] = {"bad_pixels": self.bad_pixels}
+        if self.column_offsets is not None:
+            maps["column_offsets"] = self.column_offsets
+        if self.row_offsets is not None:
+            maps["row_offsets"] = self.row_offsets
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **maps)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "PixelCorrection":
+        """Creates a correction from maps in the NumPy .npz format, as written by to_bytes()."""
+        with np.load(io.BytesIO(data)) as maps:
+            bad_pixels = maps["bad_pixels"]
+            return cls(
+                bad_pixels.shape,
+                bad_pixels=bad_pixels,
+                column_offsets=maps["column_offsets"] if "column_offsets" in maps else None,
+                row_offsets=maps["row_offsets"] if "row_offsets" in maps else None,
+            )
+
+
+class DarkAccumulator:
+    """Accumulates a sequence of dark frames and derives a PixelCorrection from it.
+
+    Only running sums are kept, so arbitrarily long sequences can be accumulated in constant memory.
+    """
+
+    def __init__(self) -> None:
+        self._sum: npt.NDArray[np.float64] | None = None
+        self._sum_sq: npt.NDArray[np.float64] | None = None
+        self.count = 0
+
+    def add(self, frame: npt.NDArray[Any]) -> None:
+        """Adds a raw dark frame to the sequence."""
+        if self._sum is None or self._sum_sq is None:
+            self._sum = np.zeros(frame.shape)
+            self._sum_sq = np.zeros(frame.shape)
+        elif frame.shape != self._sum.shape:
+            raise ValueError(f"Dark frame has shape {frame.shape}, expected {self._sum.shape}.")
+        self._sum += frame
+        self._sum_sq += np.square(frame, dtype=np.float64)
+        self.count += 1
+
+    def correction(self, sigma: float = 5.0) -> PixelCorrection:
+        """Derives column/row offsets and a bad pixel mask from the accumulated darks.
+
+        Column and row offsets are the median dark level per column and row relative to the darkest one,
+        so subtracting them flattens the dark frame down to its lowest level. Pixels are marked as bad,
+        if their mean dark level or their temporal noise is more than sigma robust standard deviations
+        above the median.
+
+        Args:
+            sigma: Rejection threshold in robust standard deviations.
+
+        Returns:
+            Pixel correction for frames of the same shape as the darks.
+        """
+        if self._sum is None or self._sum_sq is None or self.count < 2:
+            raise ValueError("Need at least two dark frames.")
+
+        mean = self._sum / self.count
+        std = np.sqrt(np.clip(self._sum_sq / self.count - mean**2, 0, None))
+
+        column_offsets = np.median(mean, axis=0)
+        column_offsets -= column_offsets.min()
+        row_offsets = np.median(mean - column_offsets[None, :], axis=1)
+        row_offsets -= row_offsets.min()
+
+        residual = mean - column_offsets[None, :] - row_offsets[:, None]
+        bad_pixels = self._outliers(residual, sigma) | self._outliers(std, sigma)
+
+        return PixelCorrection(
+            mean.shape, bad_pixels=bad_pixels, column_offsets=column_offsets, row_offsets=row_offsets
+        )
+
+    @staticmethod
+    def _outliers(data: npt.NDArray[Any], sigma: float) -> npt.NDArray[np.bool_]:
+        """Marks values more than sigma robust standard deviations above the median."""
+        median = np.median(data)
+        mad = 1.4826 * np.median(np.abs(data - median))
+        return data > median + sigma * max(float(mad), 1e-6)
+
+
+__all__ = ["DarkAccumulator", "PixelCorrection"]
@@ -91,8 +91,8 @@ async def async_main(app: QtWidgets.QApplication) -> None:
     await app_close_event.wait()
 
 
-def main() -> None:
-    app = QtWidgets.QApplication(sys.argv)
+def main(argv: list[str] | None = None) -> None:
+    app = QtWidgets.QApplication(sys.argv if argv is None else argv)
     with qasync.QEventLoop(app) as loop:
         loop.run_until_complete(async_main(app))
 
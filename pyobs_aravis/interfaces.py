@@ -0,0 +1,82 @@
+from abc import ABCMeta, abstractmethod
+from typing import Any
+
+from pyobs.interfaces import Interface
+
+
+class IAravisProfiling(Interface, metaclass=ABCMeta):
+    """The camera records timings of the individual stages of its capture path."""
+
+    __module__ = "pyobs_aravis"
+
+    @abstractmethod
+    async def set_profiling(self, enabled: bool, reset: bool = False, **kwargs: Any) -> None:
+        """Switch timing of the capture stages on or off.
+
+        Args:
+            enabled: Whether to record timings.
+            reset: Whether to drop all timings recorded so far.
+        """
+        ...
+
+    @abstractmethod
+    async def get_profile(self, bins: int = 20, **kwargs: Any) -> dict[str, Any]:
+        """Returns histograms and statistics of the recorded capture stage timings.
+
+        Args:
+            bins: Number of histogram bins.
+
+        Returns:
+            Statistics per capture stage, all times in milliseconds.
+        """
+        ...
+
+    @abstractmethod
+    async def dump_profile_trace(self, filename: str, **kwargs: Any) -> None:
+        """Writes the recorded capture stage timings as Chrome trace-event JSON.
+
+        Args:
+            filename: Name of file in the VFS to write trace to.
+        """
+        ...
+
+
+class IAravisSettings(Interface, metaclass=ABCMeta):
+    """The camera applies batches of feature changes between two frames."""
+
+    __module__ = "pyobs_aravis"
+
+    @abstractmethod
+    async def apply_settings(self, settings: dict[str, Any], wait_for_frame: bool = True, **kwargs: Any) -> int | None:
+        """Write several camera features at once, between two frames.
+
+        Args:
+            settings: Dictionary of features to write.
+            wait_for_frame: Whether to wait for the first frame taken with the new settings.
+
+        Returns:
+            Frame ID of the first frame taken with the new settings, or None if not waiting for it.
+        """
+        ...
+
+
+class IAravisPixelCorrection(Interface, metaclass=ABCMeta):
+    """The camera corrects bad pixels and column/row offsets in its frames."""
+
+    __module__ = "pyobs_aravis"
+
+    @abstractmethod
+    async def create_pixel_correction(
+        self, filename: str | None = None, frames: int = 50, sigma: float = 5.0, **kwargs: Any
+    ) -> None:
+        """Derive pixel correction maps from a sequence of dark frames and start using them.
+
+        Args:
+            filename: Name of .npz file in the VFS to write maps to, if any.
+            frames: Number of dark frames to capture.
+            sigma: Threshold for bad pixels in robust standard deviations of dark level and noise.
+        """
+        ...
+
+
+__all__ = ["IAravisPixelCorrection", "IAravisProfiling", "IAravisSettings"]
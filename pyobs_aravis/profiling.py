@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from array import array
+from typing import Any
+
+# stages of the capture path, in the order a frame passes through them
+STAGES = (
+    "buffer_wait",  # waiting for aravis to hand out a filled buffer (Camera.pop_frame)
+    "conversion",  # ctypes cast of the buffer address and wrapping it as an array
+    "copy",  # copying the frame out of the aravis buffer, so the buffer can be re-queued
+    "thread_start",  # spawning the daemon thread in AravisCamera._run_blocking until it actually runs
+    "set_image",  # handing the frame over to BaseVideo._set_image
+)
+
+
+class StageProfiler:
+    """Low-overhead timing of the individual stages of the capture path.
+
+    Each stage gets a preallocated ring buffer of (start, duration, thread) samples taken from the monotonic
+    time.perf_counter_ns() clock, so recording a sample is a handful of array stores and never allocates.
+    When disabled, record() returns immediately, so the hooks can stay in place permanently and profiling can
+    be switched on and off at runtime.
+    """
+
+    def __init__(self, size: int = 4096, enabled: bool = False):
+        """Initializes a new profiler.
+
+        Args:
+            size: Number of samples to keep per stage, older ones get overwritten.
+            enabled: Whether to record samples right away.
+        """
+        if size < 1:
+            raise ValueError("Profiler needs room for at least one sample per stage.")
+        self.enabled = enabled
+        self._size = size
+        self._start = {stage: array("q", bytes(8 * size)) for stage in STAGES}
+        self._duration = {stage: array("q", bytes(8 * size)) for stage in STAGES}
+        self._thread = {stage: array("Q", bytes(8 * size)) for stage in STAGES}
+        self._count = dict.fromkeys(STAGES, 0)
+
+    @staticmethod
+    def now() -> int:
+        """Returns the current time of the profiler's clock in nanoseconds."""
+        return time.perf_counter_ns()
+
+    def record(self, stage: str, start: int, end: int | None = None) -> None:
+        """Records a single sample for the given stage.
+
+        Samples are written without a lock; under heavy contention on a single stage, a sample may get lost,
+        which is acceptable for statistics and much cheaper than locking on every frame.
+
+        Args:
+            stage: Name of stage, one of STAGES.
+            start: Start of stage as returned by now().
+            end: End of stage as returned by now(), defaults to the current time.
+        """
+        if not self.enabled:
+            return
+        if end is None:
+            end = time.perf_counter_ns()
+        n = self._count[stage]
+        i = n % self._size
+        self._start[stage][i] = start
+        self._duration[stage][i] = end - start
+        self._thread[stage][i] = threading.get_ident()
+        self._count[stage] = n + 1
+
+    def reset(self) -> None:
+        """Drops all recorded samples."""
+        for stage in STAGES:
+            self._count[stage] = 0
+
+    def samples(self, stage: str) -> list[tuple[int, int, int]]:
+        """Returns the recorded samples for a stage.
+
+        Args:
+            stage: Name of stage, one of STAGES.
+
+        Returns:
+            List of (start, duration, thread id) tuples in nanoseconds, oldest first.
+        """
+        n = self._count[stage]
+        if n <= self._size:
+            indices = range(n)
+        else:
+            first = n % self._size
+            indices = [*range(first, self._size), *range(first)]
+        start, duration, thread = self._start[stage], self._duration[stage], self._thread[stage]
+        return [(start[i], duration[i], thread[i]) for i in indices]
+
+    def histograms(self, bins: int = 20) -> dict[str, dict[str, Any]]:
+        """Summarizes the recorded durations per stage.
+
+        Args:
+            bins: Number of logarithmically spaced histogram bins.
+
+        Returns:
+            Dictionary with statistics per stage that has samples, all times in milliseconds.
+        """
+        import numpy as np
+
+        result: dict[str, dict[str, Any]] = {}
+        for stage in STAGES:
+            samples = self.samples(stage)
+            if not samples:
+                continue
+            durations = np.array([s[1] for s in samples], dtype=float) / 1e6
+
+            # log-spaced bins, since stage times easily span several orders of magnitude
+            low, high = max(durations.min(), 1e-6), max(durations.max(), 1e-6)
+            edges = np.geomspace(low, high * (1 + 1e-9), bins + 1)
+            counts, _ = np.histogram(np.clip(durations, low, None), bins=edges)
+
+            result[stage] = {
+                "count": self._count[stage],
+                "mean": float(durations.mean()),
+                "min": float(durations.min()),
+                "p50": float(np.percentile(durations, 50)),
+                "p90": float(np.percentile(durations, 90)),
+                "p99": float(np.percentile(durations, 99)),
+                "max": float(durations.max()),
+                "edges": edges.tolist(),
+                "counts": counts.tolist(),
+            }
+        return result
+
+    def chrome_trace(self) -> dict[str, Any]:
+        """Exports all recorded samples as Chrome trace-event JSON.
+
+        The result can be written to a file and loaded into chrome://tracing or Perfetto.
+
+        Returns:
+            Trace in the Chrome "JSON object format".
+        """
+        pid = os.getpid()
+        events = [
+            {
+                "name": stage,
+                "cat": "capture",
+                "ph": "X",
+                "ts": start / 1e3,
+                "dur": duration / 1e3,
+                "pid": pid,
+                "tid": thread,
+            }
+            for stage in STAGES
+            for start, duration, thread in self.samples(stage)
+        ]
+        events.sort(key=lambda e: e["ts"])
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+__all__ = ["STAGES", "StageProfiler"]
@@ -0,0 +1,110 @@
+"""Measures cold start of pyobs_aravis, i.e. import times and time to first frame.
+
+Each measurement runs in a fresh interpreter, since anything imported before would distort the result.
+Run it as ``python -m pyobs_aravis.startup`` and pass budgets to have it fail on regressions, e.g.::
+
+    python -m pyobs_aravis.startup --first-frame --max-import 2.0 --max-first-frame 5.0
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Any
+
+# runs in the fresh interpreter, prints all times in seconds as JSON
+_MEASURE = """
+import json
+import sys
+import time
+
+times = {}
+start = time.perf_counter()
+import pyobs_aravis.aravis as aravis
+times["import_package"] = time.perf_counter() - start
+
+t = time.perf_counter()
+aravis.load_aravis()
+times["import_bindings"] = time.perf_counter() - t
+
+t = time.perf_counter()
+pyobs_aravis = sys.modules["pyobs_aravis"]
+pyobs_aravis.AravisCamera
+times["import_module"] = time.perf_counter() - t
+
+if sys.argv[1] == "1":
+    import asyncio
+
+    async def first_frame():
+        # the module's own path: device discovery, connecting, settings, stream setup, first published frame
+        device = sys.argv[2] or aravis.get_device_ids()[0]
+        camera = pyobs_aravis.AravisCamera(device=device, http_port=0)
+        t = time.perf_counter()
+        await camera.open()
+        try:
+            await asyncio.wait_for(camera._first_frame_received.wait(), timeout=60.0)
+            return time.perf_counter() - t
+        finally:
+            await camera.close()
+
+    times["first_frame"] = asyncio.run(first_frame())
+
+times["total"] = time.perf_counter() - start
+print(json.dumps(times))
+"""
+
+
+def measure_startup(first_frame: bool = False, device: str | None = None) -> dict[str, float]:
+    """Measures import times and, optionally, time to first frame in a fresh interpreter.
+
+    Args:
+        first_frame: Whether to also open an AravisCamera module and wait for its first frame.
+        device: Name of camera to connect to, defaults to the first one found.
+
+    Returns:
+        Times in seconds for importing the package, the aravis bindings and the pyobs module, from
+        AravisCamera.open() to its first frame, if requested, and in total. If the measurement fails, its
+        error output is printed and the process exits with the measurement's return code.
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", _MEASURE, "1" if first_frame else "0", device or ""],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        # the child's traceback is the only hint on what went wrong, e.g. no camera or missing bindings
+        print(result.stderr, file=sys.stderr, end="")
+        sys.exit(result.returncode)
+    times: dict[str, float] = json.loads(result.stdout.strip().splitlines()[-1])
+    return times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure cold start of pyobs_aravis.")
+    parser.add_argument("--first-frame", action="store_true", help="also measure time to first frame")
+    parser.add_argument("--device", help="camera to connect to, defaults to first one found")
+    parser.add_argument("--repeat", type=int, default=5, help="number of runs to take the median of")
+    parser.add_argument("--max-import", type=float, help="fail if importing everything takes longer")
+    parser.add_argument("--max-first-frame", type=float, help="fail if the first frame takes longer")
+    args = parser.parse_args()
+
+    first_frame = args.first_frame or args.max_first_frame is not None
+    runs = [measure_startup(first_frame=first_frame, device=args.device) for _ in range(args.repeat)]
+    median: dict[str, Any] = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    for key, value in median.items():
+        print(f"{key:16s} {value:8.3f}s")
+
+    failed = False
+    import_time = median["import_package"] + median["import_bindings"] + median["import_module"]
+    if args.max_import is not None and import_time > args.max_import:
+        print(f"Import took {import_time:.3f}s, budget is {args.max_import:.3f}s.", file=sys.stderr)
+        failed = True
+    if args.max_first_frame is not None and median["first_frame"] > args.max_first_frame:
+        print(f"First frame took {median['first_frame']:.3f}s, budget is {args.max_first_frame:.3f}s.", file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()